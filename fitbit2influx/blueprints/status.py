@@ -1,9 +1,12 @@
 # Fitbit2Influx Status Page
+import os
 import shelve
 
-from flask import Blueprint, current_app, render_template
+from flask import Blueprint, current_app, render_template, send_from_directory
 
+from ..cache import cache
 from ..influx import influx
+from ..profiling import list_profiles
 from ..scheduler import scheduler
 
 bp = Blueprint('status', __name__, url_prefix='/', template_folder='templates')
@@ -35,6 +38,7 @@ def status_index():
         scheduler=scheduler,
         influx_uri=influx.client._baseurl,
         influx_db=influx.client._database,
+        cache_stats=cache.stats(),
     )
 
 
@@ -54,6 +58,28 @@ def oauth_debug():
     return oauth_data
 
 
+@bp.route('/profiles', methods=['GET'])
+def profiles_index():
+    '''List recent Import Profiles and Runs'''
+    run_log = []
+    with shelve.open(current_app.config['SHELVE_FILENAME'], 'r') as shelf:
+        run_log = shelf.get('run_log', [])
+
+    return {
+        'profiles': list_profiles(current_app),
+        'runs': list(reversed(run_log)),
+    }
+
+
+@bp.route('/profiles/<path:filename>', methods=['GET'])
+def profiles_download(filename):
+    '''Download a saved Profile File'''
+    path = current_app.config.get('PROFILE_DIR', 'instance/profiles')
+    return send_from_directory(
+        os.path.abspath(path), filename, as_attachment=True
+    )
+
+
 @bp.route('/test', methods=['GET'])
 def oauth_test():
     '''Print User Profile'''
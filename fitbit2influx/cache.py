@@ -0,0 +1,168 @@
+# Fitbit2Influx Intraday Data Cache
+
+import collections
+import datetime
+import dbm
+import shelve
+import threading
+
+
+class IntradayCache(object):
+    '''
+    Two-Tier Cache for Fitbit Intraday Responses
+
+    Caches the raw per-day intraday API responses keyed by user, metric, day
+    and detail level. Entries live in a ShelveDB file on disk, with an LRU
+    memory tier in front of it so repeated lookups do not need to reopen the
+    shelf. The memory tier is bounded by the total number of intraday points
+    it holds rather than the number of days, since a day of `1sec` data is
+    around 60 times larger than a day of `1min` data.
+
+    Only days which are complete are stored. A day is considered complete once
+    the tracker has synced at some point after the end of that day, since no
+    further data can be uploaded for it after that and the response will never
+    change. Incomplete days (including today) are always fetched from the API.
+    '''
+    def __init__(self, app=None):
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.filename = None
+        self.max_points = 0
+        self._points = 0
+        self.hits = 0
+        self.misses = 0
+        self.app = app
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Setup the Cache Storage'''
+        self.filename = app.config.get('CACHE_FILENAME', None)
+        self.max_points = int(app.config.get('CACHE_MEMORY_POINTS', 100000))
+
+        self.app = app
+        self.app.intraday_cache = self
+
+    @staticmethod
+    def make_key(user_id, metric, day, detail):
+        '''Construct the Cache Key for a single day of intraday data'''
+        return f'{user_id}/{metric}/{day.strftime("%Y-%m-%d")}/{detail}'
+
+    @staticmethod
+    def is_complete(day, last_sync):
+        '''
+        Check if a day of intraday data is complete
+
+        Returns `True` if the tracker last synced after the end of the day,
+        meaning the data for that day is final. The `last_sync` value must be
+        a naive `datetime` in Fitbit-local time, or `None` if unknown.
+        '''
+        if last_sync is None:
+            return False
+
+        day_end = datetime.datetime.combine(
+            day + datetime.timedelta(days=1), datetime.time()
+        )
+        return last_sync >= day_end
+
+    @staticmethod
+    def count_points(data):
+        '''Count the intraday points in a cached response'''
+        return sum(
+            len(v.get('dataset', []))
+            for k, v in data.items()
+            if k.endswith('-intraday') and isinstance(v, dict)
+        )
+
+    @property
+    def enabled(self):
+        '''Return `True` if a cache file is configured'''
+        return bool(self.filename)
+
+    def _remember(self, key, data):
+        '''Insert an entry in the memory tier and evict old entries'''
+        n_points = self.count_points(data)
+        if n_points > self.max_points:
+            return
+
+        if key in self._memory:
+            self._points -= self._memory.pop(key)[1]
+
+        self._memory[key] = (data, n_points)
+        self._points += n_points
+        while self._points > self.max_points:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._points -= evicted
+
+    def get(self, key):
+        '''Look up a cached response, returning `None` if not found'''
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key][0]
+
+            try:
+                with shelve.open(self.filename, 'r') as shelf:
+                    data = shelf.get(key, None)
+            except dbm.error:
+                # Cache file has not been created yet
+                data = None
+
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._remember(key, data)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        '''Store a response for a completed day'''
+        if not self.enabled:
+            return
+
+        with self._lock:
+            # The cache is only an optimization, so a failure to write (e.g.
+            # another process holding the write lock) must not fail the import
+            try:
+                with shelve.open(self.filename, 'c') as shelf:
+                    shelf[key] = data
+            except dbm.error as e:
+                self.app.logger.warning(
+                    f'Could not write {key} to the intraday cache: {e}'
+                )
+
+            self._remember(key, data)
+
+    def clear(self):
+        '''Remove all cached responses from both tiers'''
+        with self._lock:
+            self._memory.clear()
+            self._points = 0
+            if self.enabled:
+                with shelve.open(self.filename, 'n'):
+                    pass
+
+    def stats(self):
+        '''Return cache statistics for the status page'''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_items': len(self._memory),
+            'memory_points': self._points,
+            'memory_max_points': self.max_points,
+        }
+
+
+#: Intraday Data Cache
+cache = IntradayCache()
+
+
+def init_app(app):
+    '''Initialize the Intraday Data Cache'''
+    cache.init_app(app)
+    app.logger.info('Initialized Intraday Cache')
@@ -0,0 +1,39 @@
+# Fitbit2Influx Command Line Interface
+
+import click
+
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('backfill')
+@click.option(
+    '--since',
+    type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']),
+    default=None,
+    help='Fitbit-local date or time to import from (default: last point)',
+)
+@click.option(
+    '--profile/--no-profile',
+    default=None,
+    help='Profile the run (default: PROFILE_IMPORTS setting)',
+)
+@with_appcontext
+def backfill_command(since, profile):
+    '''
+    Import Fitbit data into InfluxDB
+
+    The application factory does not start the background import scheduler
+    for this command, so scheduled imports cannot run during a backfill.
+    '''
+    from .scheduler import run_import
+
+    n_points = run_import(
+        current_app, since=since, profile=profile, trigger='cli'
+    )
+    click.echo(f'Imported {n_points} points')
+
+
+def init_app(app):
+    '''Register CLI Commands with the Application'''
+    app.cli.add_command(backfill_command)
@@ -1,14 +1,43 @@
 # Fitbit2Influx Applicatin Factory
 
-import configparser
-import pathlib
 import os
+import time
 
 from flask import Flask
 
+from .util import config_flag, max_rss_mb
+
+#: Distribution Name used to look up Package Metadata
+DIST_NAME = 'fitbit2influx'
+
 
 def read_version():
+    '''
+    Read the Name and Version String
+
+    The installed package metadata is used if it is available. Otherwise
+    (e.g. when running from a source checkout or the Docker image, where the
+    package is not installed) fall back to parsing pyproject.toml.
+    '''
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is not None:
+        try:
+            return (DIST_NAME, metadata.version(DIST_NAME))
+        except metadata.PackageNotFoundError:
+            pass
+
+    return read_pyproject_version()
+
+
+def read_pyproject_version():
     '''Read the Name and Version String from pyproject.toml'''
+    import configparser
+    import pathlib
+
     # Search for pyproject.toml
     d = pathlib.Path(__file__)
     name = None
@@ -29,6 +58,26 @@ def read_version():
     return (None, None)
 
 
+def _cli_command():
+    '''
+    Get the Flask CLI Command being run
+
+    Returns the name of the `flask` subcommand for which the application is
+    being loaded, or `None` if the application is not being loaded by the CLI
+    (e.g. under gunicorn, or by the `flask run` reloader thread). Custom
+    commands such as `backfill` are resolved by loading the application from
+    the `flask` command group itself, before the subcommand context exists;
+    the group name is returned in that case.
+    '''
+    import click
+
+    ctx = click.get_current_context(silent=True)
+    if ctx is None:
+        return None
+
+    return ctx.info_name
+
+
 def create_app(app_config=None, app_name=None):
     '''
     Create and Configure the Application with the Flask `Application Factory`_
@@ -43,6 +92,7 @@ def create_app(app_config=None, app_name=None):
     :returns: Flask application instance
     :rtype: :class:`Flask`
     '''
+    start_time = time.perf_counter()
     app = Flask(
         'jadetree',
         static_folder='frontend/static',
@@ -87,20 +137,49 @@ def create_app(app_config=None, app_name=None):
         from . import influx
         influx.init_app(app)
 
+        # Initialize Intraday Cache
+        from . import cache
+        cache.init_app(app)
+
+        # Compile the Point Transform Pipeline
+        from . import transform
+        transform.init_app(app)
+
         # Register Blueprints
         from .blueprints import oauth, status
         app.register_blueprint(oauth.bp)
         app.register_blueprint(status.bp)
         app.logger.info('Registered Blueprints')
 
+        # Register CLI Commands
+        from . import cli
+        cli.init_app(app)
+
         # Initialize Import Scheduler and start. Note that Flask Debug mode
         # causes this to run twice, so the check ensures that the scheduler
         # is only set up in the Werkzeug main worker thread.
+        # Web-only workers can set SCHEDULER_ENABLED to false, in which case
+        # APScheduler is never imported. The scheduler is also not started
+        # for Flask CLI commands other than `run` (e.g. `flask backfill`), so
+        # scheduled imports do not run alongside the command.
         is_dev = app.debug or os.environ.get('FLASK_ENV') == 'development'
+        cli_command = _cli_command()
         if not is_dev or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-            from . import scheduler
-            scheduler.init_app(app)
-            scheduler.scheduler.start()
+            if cli_command not in (None, 'run'):
+                app.logger.info(
+                    f'Not starting scheduler for CLI ({cli_command})'
+                )
+            elif config_flag(app.config.get('SCHEDULER_ENABLED', True)):
+                from . import scheduler
+                scheduler.init_app(app)
+                scheduler.scheduler.start()
+
+        # Log Startup Time and Memory Usage
+        app.logger.info(
+            'Application started in %.1f ms (max RSS %s MB)',
+            (time.perf_counter() - start_time) * 1000,
+            max_rss_mb(),
+        )
 
         # Return Application
         return app
@@ -1,12 +1,17 @@
 # Fitbit2InfluxDB Influx Connection
 
-import influxdb
-
 
 class InfluxDB(object):
-    '''InfluxDB Helper for Flask'''
+    '''
+    InfluxDB Helper for Flask
+
+    The `influxdb` package (which also tries to import pandas) is only
+    imported and the client only constructed on first access to
+    :attr:`client`, which keeps it off the application startup path.
+    '''
     def __init__(self, app=None):
         self._client = None
+        self._client_args = None
         self.app = app
         if app:
             self.init_app(app)
@@ -23,13 +28,18 @@ class InfluxDB(object):
             'verify_ssl': app.config.get('INFLUX_VERIFY_SSL', False),
         }
 
-        self._client = influxdb.InfluxDBClient(**client_args)
+        self._client = None
+        self._client_args = client_args
 
         self.app = app
         self.app.influx = self
 
     @property
     def client(self):
+        if self._client is None and self._client_args is not None:
+            import influxdb
+            self._client = influxdb.InfluxDBClient(**self._client_args)
+
         return self._client
 
 
@@ -0,0 +1,307 @@
+# Fitbit2Influx Import Profiling
+
+import collections
+import contextlib
+import datetime
+import os
+import sys
+import time
+
+from flask import g, has_app_context
+
+from fitbit2influx.error import ConfigError
+
+#: Supported Profiler Modes
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+class PhaseTimer(object):
+    '''
+    Accumulate Wall-Clock Time by Import Phase
+
+    Phases may be entered many times during a run (e.g. `http` once per day
+    fetched), so the total time and number of calls are kept for each.
+    '''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = collections.OrderedDict()
+        self.counts = collections.Counter()
+
+    def add(self, name, elapsed):
+        '''Add elapsed time (in seconds) to a phase'''
+        self.totals[name] = self.totals.get(name, 0.0) + elapsed
+        self.counts[name] += 1
+
+    def elapsed(self):
+        '''Return the total elapsed time of the run in seconds'''
+        return time.perf_counter() - self.started
+
+    def report(self):
+        '''Return the phase timings in milliseconds'''
+        return {
+            name: {
+                'ms': round(total * 1000, 3),
+                'calls': self.counts[name],
+            }
+            for name, total in self.totals.items()
+        }
+
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    Time a Phase of the current Import Run
+
+    This is a no-op unless called within an application context in which
+    :func:`run_timer` is active, so it is safe to use from service functions
+    which are also called outside of import runs.
+    '''
+    timer = g.get('phase_timer') if has_app_context() else None
+    if timer is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def run_timer():
+    '''Activate a :class:`PhaseTimer` for the current application context'''
+    timer = PhaseTimer()
+    g.phase_timer = timer
+    try:
+        yield timer
+    finally:
+        g.pop('phase_timer', None)
+
+
+def _gevent_patched():
+    '''Check if the `threading` module is monkey-patched by gevent'''
+    if 'gevent' not in sys.modules:
+        return False
+
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def _real_thread_api():
+    '''
+    Get the OS-level `start_new_thread`, `get_ident` and `sleep` functions
+
+    Under the gevent worker the `threading` and `time` modules are
+    monkey-patched, so the originals are needed for the sampler to run on a
+    real thread.
+    '''
+    import _thread
+
+    if _gevent_patched():
+        from gevent import monkey
+        return (
+            monkey.get_original('_thread', 'start_new_thread'),
+            monkey.get_original('_thread', 'get_ident'),
+            monkey.get_original('time', 'sleep'),
+        )
+
+    return (_thread.start_new_thread, _thread.get_ident, time.sleep)
+
+
+class Sampler(object):
+    '''
+    Sampling Profiler for a single Thread or Greenlet
+
+    Samples the stack of the thread which started it at a fixed interval and
+    counts identical stacks, which can be written in the collapsed-stack
+    format used by `flamegraph.pl` and speedscope.
+
+    Under gevent the OS thread is shared by all greenlets, so the greenlet
+    which started the sampler is tracked instead. While it is suspended (e.g.
+    waiting on HTTP) its saved frame is sampled, and while it is running the
+    frame of the OS thread is sampled.
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._start_thread, self._get_ident, self._sleep = _real_thread_api()
+        self._target = None
+        self._greenlet = None
+        self._running = False
+        self._done = False
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        return f'{module}:{code.co_name}:{frame.f_lineno}'
+
+    def _target_frame(self):
+        '''Get the current frame of the sampled thread or greenlet'''
+        if self._greenlet is not None:
+            if self._greenlet.dead:
+                return None
+
+            # gr_frame is only set while the greenlet is suspended
+            frame = self._greenlet.gr_frame
+            if frame is not None:
+                return frame
+
+        return sys._current_frames().get(self._target)
+
+    def _run(self):
+        try:
+            while self._running:
+                frame = self._target_frame()
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self._sleep(self.interval)
+        finally:
+            self._done = True
+
+    def start(self):
+        '''Start sampling the calling thread or greenlet'''
+        self._target = self._get_ident()
+        self._greenlet = None
+        if _gevent_patched():
+            import greenlet
+            self._greenlet = greenlet.getcurrent()
+
+        self._running = True
+        self._done = False
+        self._start_thread(self._run, ())
+
+    def stop(self):
+        '''Stop sampling and wait for the sampler thread to exit'''
+        self._running = False
+        deadline = time.perf_counter() + max(1.0, self.interval * 10)
+        while not self._done and time.perf_counter() < deadline:
+            self._sleep(self.interval / 2)
+
+    def write_collapsed(self, path):
+        '''Write the samples in collapsed-stack format'''
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def profile_dir(app):
+    '''Get the Profile Output Directory, creating it if needed'''
+    path = app.config.get('PROFILE_DIR', 'instance/profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def prune_profiles(app):
+    '''Delete all but the most recent `PROFILE_KEEP` profiles'''
+    keep = int(app.config.get('PROFILE_KEEP', 20))
+    path = profile_dir(app)
+    for prof in list_profiles(app)[keep:]:
+        for filename in prof['files']:
+            os.remove(os.path.join(path, filename))
+
+
+def list_profiles(app):
+    '''
+    List saved Profiles, newest first
+
+    Each profile is a dictionary with the profile `name` (the common file
+    stem), its `created` time, total `size` in bytes and a list of `files`.
+    '''
+    path = app.config.get('PROFILE_DIR', 'instance/profiles')
+    if not os.path.isdir(path):
+        return []
+
+    profiles = {}
+    for filename in os.listdir(path):
+        stem = filename.rsplit('.', 1)[0]
+        stat = os.stat(os.path.join(path, filename))
+        prof = profiles.setdefault(stem, {
+            'name': stem,
+            'created': stat.st_mtime,
+            'size': 0,
+            'files': [],
+        })
+        prof['created'] = min(prof['created'], stat.st_mtime)
+        prof['size'] += stat.st_size
+        prof['files'].append(filename)
+
+    ret = sorted(profiles.values(), key=lambda p: p['created'], reverse=True)
+    for prof in ret:
+        prof['created'] = datetime.datetime.fromtimestamp(
+            prof['created']
+        ).isoformat()
+        prof['files'].sort()
+
+    return ret
+
+
+@contextlib.contextmanager
+def profile_run(app, name):
+    '''
+    Profile a Block of Code
+
+    Runs the block under the profiler selected by `PROFILE_MODE` and saves
+    the output in `PROFILE_DIR` with a timestamped file stem. The context
+    manager yields an empty list, to which the file stem is appended when the
+    block exits so that callers can record it.
+
+    In `cprofile` mode a `.prof` file (for `pstats`, snakeviz, etc.) and a
+    `.txt` summary sorted by cumulative time are written. In `sample` mode a
+    `.collapsed` stack file suitable for flame graphs is written.
+
+    cProfile profiles the whole OS thread, which under gevent includes the
+    hub and any other greenlets (e.g. web requests) that run while the import
+    waits on I/O. When gevent is active, `sample` mode is used instead and a
+    warning is logged.
+    '''
+    mode = str(app.config.get('PROFILE_MODE', 'cprofile')).lower()
+    if mode not in PROFILE_MODES:
+        raise ConfigError(
+            f'PROFILE_MODE must be one of {", ".join(PROFILE_MODES)}',
+            config_key='PROFILE_MODE',
+        )
+
+    if mode == 'cprofile' and _gevent_patched():
+        app.logger.warning(
+            'PROFILE_MODE=cprofile cannot isolate the import greenlet under '
+            'gevent; using sample mode instead (set PROFILE_MODE=sample)'
+        )
+        mode = 'sample'
+
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    stem = os.path.join(profile_dir(app), f'{name}-{stamp}')
+    result = []
+
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = Sampler(
+            float(app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+        )
+        profiler.start()
+
+    try:
+        yield result
+    finally:
+        if mode == 'cprofile':
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(f'{stem}.prof')
+            with open(f'{stem}.txt', 'w') as f:
+                stats = pstats.Stats(profiler, stream=f)
+                stats.sort_stats('cumulative').print_stats(40)
+        else:
+            profiler.stop()
+            profiler.write_collapsed(f'{stem}.collapsed')
+
+        result.append(os.path.basename(stem))
+        app.logger.info(f'Saved {mode} profile {os.path.basename(stem)}')
+        prune_profiles(app)
@@ -3,18 +3,25 @@
 import datetime
 import shelve
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from flask import current_app
 from functools import wraps
 
 from fitbit2influx.influx import influx
-from fitbit2influx.service.fitbit import get_heartrate, get_user_profile
+from fitbit2influx.profiling import phase, profile_run, run_timer
+from fitbit2influx.util import config_flag
 
 
 class APScheduler(object):
-    '''Flask Integration for APScheduler'''
+    '''
+    Flask Integration for APScheduler
+
+    If no scheduler instance is passed, a `BackgroundScheduler` is created on
+    first use so that APScheduler is not imported by web-only workers. Jobs
+    declared with :attr:`task` are held until the scheduler is created.
+    '''
     def __init__(self, scheduler=None, app=None):
-        self._scheduler = scheduler or BackgroundScheduler()
+        self._scheduler = scheduler
+        self._pending_jobs = []
         self.app = None
         if app:
             self.init_app(app)
@@ -23,25 +30,40 @@ class APScheduler(object):
         '''Register the extension with the application'''
         self.app = app
         self.app.apscheduler = self
-        self.app.logger.debug(
-            'Registering APScheduler with '
-            f'{self._scheduler.__class__.__name__} worker'
-        )
+        self.app.logger.debug('Registering APScheduler')
 
     @property
     def running(self):
         '''Return the Scheduler State'''
+        if self._scheduler is None:
+            return 0
         return self._scheduler.state
 
     @property
     def scheduler(self):
         '''Get the currently active Scheduler'''
+        if self._scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            self._scheduler = BackgroundScheduler()
+
+        if self._pending_jobs:
+            for func, args, kwargs in self._pending_jobs:
+                self._scheduler.add_job(func, *args, **kwargs)
+            self._pending_jobs = []
+
         return self._scheduler
 
     @property
     def task(self):
         '''Return a Task Decorator for the Scheduler'''
-        return self._scheduler.scheduled_job
+        def decorator(*args, **kwargs):
+            def wrapper(func):
+                self._pending_jobs.append((func, args, kwargs))
+                return func
+
+            return wrapper
+
+        return decorator
 
     @property
     def with_appcontext(self):
@@ -74,8 +96,11 @@ class APScheduler(object):
 
     def start(self, paused=False):
         '''Start the scheduler, optionally in a paused state'''
-        self.app.logger.info('Starting Scheduler')
-        self._scheduler.start(paused=paused)
+        self.app.logger.info(
+            'Starting Scheduler with '
+            f'{self.scheduler.__class__.__name__} worker'
+        )
+        self.scheduler.start(paused=paused)
 
 
 #: Fitbit2Influx Import Scheduler
@@ -86,55 +111,178 @@ scheduler = APScheduler()
 @scheduler.task('cron', minute='*/15')
 @scheduler.with_appcontext
 def import_data():
-    current_app.logger.info('Downloading new Fitbit data')
+    '''Scheduled Job to import new Fitbit data'''
+    run_import(current_app)
+
+
+def run_import(app, since=None, profile=None, trigger='scheduler'):
+    '''
+    Import Fitbit Data into InfluxDB
 
-    # Get the User Profile
-    profile = get_user_profile(current_app)
-    utc_offset = datetime.timedelta(
-        milliseconds=profile['user']['offsetFromUTCMillis']
+    Imports data starting at `since` (a `date` or naive Fitbit-local
+    `datetime`), or from the last imported point if not given. Per-phase
+    timings for each run are stored in the run log. If `profile` is `True`
+    (or `None` and `PROFILE_IMPORTS` is set) the run is also profiled and the
+    output saved under `PROFILE_DIR`.
+
+    Returns the number of points written.
+    '''
+    if profile is None:
+        profile = config_flag(app.config.get('PROFILE_IMPORTS', False))
+
+    entry = {
+        'started': datetime.datetime.now().isoformat(),
+        'trigger': trigger,
+        'points': 0,
+        'profile': None,
+        'error': None,
+    }
+
+    prof = []
+    with run_timer() as timer:
+        try:
+            if profile:
+                with profile_run(app, f'import-{trigger}') as prof:
+                    entry['points'] = _import_data(app, since)
+            else:
+                entry['points'] = _import_data(app, since)
+
+        except Exception as e:
+            entry['error'] = f'{e.__class__.__name__}: {e}'
+            raise
+
+        finally:
+            entry['profile'] = prof[0] if prof else None
+            entry['duration_ms'] = round(timer.elapsed() * 1000, 3)
+            entry['phases'] = timer.report()
+            record_run(app, entry)
+
+    return entry['points']
+
+
+def record_run(app, entry):
+    '''Log an Import Run and save it to the Run Log'''
+    phases = ', '.join(
+        f'{k}={v["ms"]:.1f}ms/{v["calls"]}'
+        for k, v in entry['phases'].items()
+    )
+    app.logger.info(
+        f'Import run finished in {entry["duration_ms"]:.1f} ms '
+        f'({entry["points"]} points; {phases or "no phases"})'
     )
 
+    size = int(app.config.get('RUN_LOG_SIZE', 50))
+    with shelve.open(app.config['SHELVE_FILENAME'], 'c') as shelf:
+        run_log = shelf.get('run_log', [])
+        run_log.append(entry)
+        shelf['run_log'] = run_log[-size:]
+
+
+def _import_data(app, since=None):
+    '''Fetch, transform and write new data, returning the point count'''
+    from fitbit2influx.service.fitbit import (
+        get_devices,
+        get_user_profile,
+        iter_heartrate,
+    )
+
+    app.logger.info('Downloading new Fitbit data')
+    pipeline = app.transform_pipeline
+
+    # Get the User Profile and build the run context for the transform
+    # pipeline. Devices are only fetched if a derived tag requires them.
+    profile = get_user_profile(app)
+    context = {
+        'utc_offset': profile['user']['offsetFromUTCMillis'] // 1000,
+        'user_id': profile['user']['encodedId'],
+    }
+
+    devices = None
+    if pipeline.uses('device_id') or pipeline.uses('device_version'):
+        devices = get_devices(app)
+        trackers = [d for d in devices if d.get('type') == 'TRACKER']
+        if trackers or devices:
+            device = (trackers or devices)[0]
+            context['device_id'] = device.get('id')
+            context['device_version'] = device.get('deviceVersion')
+
     # Try and look up the last inserted timestamp
     last_pt = None
-    with shelve.open(current_app.config['SHELVE_FILENAME'], 'r') as shelf:
-        if 'last_point' in shelf:
-            last_pt = shelf['last_point']
+    with phase('state'):
+        with shelve.open(app.config['SHELVE_FILENAME'], 'r') as shelf:
+            if 'last_point' in shelf:
+                last_pt = shelf['last_point']
+
+    # Load and transform heart rate data one day at a time, combining days
+    # which share the same tags into a single write. Any device list fetched
+    # above is reused so devices.json is requested at most once per run.
+    batches = []
+    last_day = None
+    last_time = None
+
+    # When resuming from the last imported point, skip that point itself.
+    # Rewriting it is not harmless since per-day tags (e.g. resting heart
+    # rate) can change during the day and would put it in a new series.
+    skip_day = None
+    skip_time = None
+    if since is None and isinstance(last_pt, datetime.datetime):
+        skip_day = last_pt.date()
+        skip_time = last_pt.strftime('%H:%M:%S')
 
-    # Load heart rate data
-    hr_data = get_heartrate(current_app, last_pt or 'today')
-    if not len(hr_data):
-        current_app.logger.info('No new heart rate points to send to InfluxDB')
-        return
+    since = since or last_pt or 'today'
+    for day, summary, dataset in iter_heartrate(
+        app, since, devices=devices
+    ):
+        if day == skip_day:
+            dataset = [pt for pt in dataset if pt['time'] > skip_time]
+
+        if not dataset:
+            continue
+
+        last_day = day
+        last_time = dataset[-1]['time']
+
+        with phase('transform'):
+            points, tags = pipeline(day, summary, dataset, context)
+
+        if batches and batches[-1][1] == tags:
+            batches[-1][0].extend(points)
+        else:
+            batches.append((points, tags))
+
+    if last_day is None:
+        app.logger.info('No new heart rate points to send to InfluxDB')
+        return 0
 
     # Insert new data points
-    json_pts = [
-        {
-            'measurement': 'heartRate',
-            'time': (pt[0] - utc_offset).isoformat(),
-            'fields': {
-                'bpm': pt[1],
-            },
-        }
-        for pt in hr_data
-    ]
-
-    ret = influx.client.write_points(
-        json_pts,
-        protocol='json',
-        time_precision='s',
-        tags={
-            'userId': profile['user']['encodedId'],
-        },
-    )
+    n_points = 0
+    for points, tags in batches:
+        if not points:
+            continue
 
-    if not ret:
-        current_app.logger.error('Failed to write data to Influx')
+        n_points += len(points)
+        with phase('write'):
+            ret = influx.client.write_points(
+                points,
+                protocol='json',
+                time_precision='s',
+                tags=tags,
+            )
+
+        if not ret:
+            app.logger.error('Failed to write data to Influx')
 
     # Save last retrieved data point
-    current_app.logger.info(f'Inserting {len(hr_data)} new heart rate points')
-    with shelve.open(current_app.config['SHELVE_FILENAME'], 'c') as shelf:
-        shelf['last_point'] = hr_data[-1][0]
-        shelf['last_count'] = len(hr_data)
+    app.logger.info(f'Inserting {n_points} new heart rate points')
+    h, m, s = [int(x) for x in last_time.split(':')]
+    with phase('state'):
+        with shelve.open(app.config['SHELVE_FILENAME'], 'c') as shelf:
+            shelf['last_point'] = datetime.datetime.combine(
+                last_day, datetime.time(h, m, s)
+            )
+            shelf['last_count'] = n_points
+
+    return n_points
 
 
 def init_app(app):
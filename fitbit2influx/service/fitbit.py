@@ -1,18 +1,23 @@
 # Fitbit2Influx Fitbit Service
 
 import datetime
-import requests
 
 from urllib.parse import quote, urlencode, urlunparse
 
+from fitbit2influx.cache import cache
 from fitbit2influx.error import ApiError
+from fitbit2influx.profiling import phase
 
-from .oauth import get_api_token
+from .oauth import get_api_token, get_user_id
 
 
 def api_get(app, url_endpoint, query=None, headers={}, **kwargs):
     '''Perform a GET request to the Fitbit API'''
-    token = get_api_token(app)
+    import requests
+
+    with phase('token'):
+        token = get_api_token(app)
+
     url_host = app.config['FITBIT_API_HOST']
     url_params = None
     if query is not None:
@@ -22,11 +27,16 @@ def api_get(app, url_endpoint, query=None, headers={}, **kwargs):
     headers['Authorization'] = f'Bearer {token}'
 
     app.logger.debug(f'Sending GET to {url_endpoint}')
-    response = requests.get(url, headers=headers, **kwargs)
+    with phase('http'):
+        response = requests.get(url, headers=headers, **kwargs)
+
+    with phase('json'):
+        data = response.json()
+
     if response.status_code != 200:
-        raise ApiError.from_response(response.json())
+        raise ApiError.from_response(data)
 
-    return response.json()
+    return data
 
 
 def get_user_profile(app):
@@ -34,62 +44,165 @@ def get_user_profile(app):
     return api_get(app, '/1/user/-/profile.json')
 
 
-def get_heartrate(app, since='today', detail='1min'):
+def get_devices(app):
+    '''Get the List of Paired Devices'''
+    return api_get(app, '/1/user/-/devices.json')
+
+
+def get_last_sync_time(app, devices=None):
     '''
-    Get Heart Rate Data
+    Get the Last Tracker Sync Time
 
-    This calls the Fitbit Heart Rate Intraday Time Series endpoint with the
-    parameters taken from argument values. The `since` parameter specifies
-    the starting date and time for the measurement or can contain the string
-    `today`, which will return all points from today.
+    Returns the most recent `lastSyncTime` across all paired trackers as a
+    naive `datetime` in Fitbit-local time, or `None` if no tracker has synced.
+    Other devices (e.g. scales) are ignored, since their syncs say nothing
+    about whether the tracker has uploaded its intraday data. The device list
+    is fetched from the API unless `devices` is given.
+    '''
+    if devices is None:
+        devices = get_devices(app)
 
-    Note that the Fitbit API only returns intraday data within a single day,
-    so this method will send multiple requests for each day of data from the
-    `since` parameter until today.  If the `since` parameter is a `datetime`
-    object, the time will also be used to filter out points before the time
-    given. Note that the `datetime` instances will be interpreted as user-local
-    time by Fitbit and no timezone data is passed, so the instances should be
-    naive objects without timezone data.
+    last_sync = None
+    for device in devices:
+        if device.get('type') != 'TRACKER':
+            continue
+        if not device.get('lastSyncTime'):
+            continue
 
-    The return value is an array of (`dt`, `bpm`) tuples where the `dt` value
-    is a naive `datetime` object in the Fitbit-local time zone and `bpm` is the
-    heart rate in beats per minute.
+        dt = datetime.datetime.strptime(
+            device['lastSyncTime'][:19], '%Y-%m-%dT%H:%M:%S'
+        )
+        if last_sync is None or dt > last_sync:
+            last_sync = dt
+
+    return last_sync
+
+
+def get_intraday(app, metric, day, detail, last_sync=None, user_id=None):
+    '''
+    Get a single day of Intraday Time Series Data
+
+    Returns the raw API response for the intraday `metric` on `day`. Responses
+    for days which the device has fully synced (see
+    :meth:`IntradayCache.is_complete`) are stored in the intraday cache and
+    returned from there on subsequent calls without touching the network.
+    The `user_id` used in the cache key is looked up if not given.
+    '''
+    key = None
+    if cache.enabled:
+        with phase('cache'):
+            key = cache.make_key(
+                user_id or get_user_id(app), metric, day, detail
+            )
+            data = cache.get(key)
+
+        if data is not None:
+            app.logger.debug(f'Using cached {metric} data for {day}')
+            return data
+
+    endpoint = f'date/{day.strftime("%Y-%m-%d")}/1d/{detail}.json'
+    data = api_get(app, f'/1/user/-/activities/{metric}/{endpoint}')
+
+    if f'activities-{metric}-intraday' not in data:
+        raise ApiError(
+            f'Did not receive intraday {metric} data from {endpoint}'
+        )
+
+    if key is not None and cache.is_complete(day, last_sync):
+        cache.put(key, data)
+
+    return data
+
+
+def iter_heartrate(app, since='today', detail='1min', devices=None):
+    '''
+    Iterate over Heart Rate Data by Day
+
+    This calls the Fitbit Heart Rate Intraday Time Series endpoint for each
+    day from the `since` parameter until today and yields a tuple of (`day`,
+    `summary`, `dataset`) for each day. The `summary` value is the daily
+    `activities-heart` summary (which includes the resting heart rate) or
+    `None` if not present, and `dataset` is the raw list of intraday points,
+    each a dictionary with `time` (as a Fitbit-local `hh:mm:ss` string) and
+    `value` keys.
+
+    Days which have been fully synced are served from the intraday cache
+    rather than the API. The device list used to find the last sync time can
+    be passed in `devices` if the caller has already fetched it. See
+    :func:`get_heartrate` for the interpretation of the `since` parameter.
     '''
     today = datetime.date.today()
     f_date = datetime.date.today()
-    f_time = datetime.datetime.now().replace(
-        hour=0, minute=0, second=0, microsecond=0,
-    )
+    f_time = None
 
     if isinstance(since, datetime.datetime):
         f_date = since.date()
-        f_time = since
+        f_time = since.strftime('%H:%M:%S')
 
     elif isinstance(since, datetime.date):
         f_date = since
-        f_time = datetime.datetime.combine(since, datetime.time())
+
+    # Only look up the device sync time when fetching past days, since it is
+    # needed to decide whether those days can be cached
+    last_sync = None
+    user_id = None
+    if cache.enabled:
+        user_id = get_user_id(app)
+        if f_date < today:
+            last_sync = get_last_sync_time(app, devices)
 
     # Fetch day by day through today
-    ret_data = []
     while f_date <= today:
-        hr_endpoint = f'date/{f_date.strftime("%Y-%m-%d")}/1d/{detail}.json'
-        hr_data = api_get(app, f'/1/user/-/activities/heart/{hr_endpoint}')
+        hr_data = get_intraday(
+            app, 'heart', f_date, detail, last_sync, user_id
+        )
+        dataset = hr_data['activities-heart-intraday']['dataset']
 
-        if 'activities-heart-intraday' not in hr_data:
-            raise ApiError(
-                f'Did not receive intraday heart rate data from {hr_endpoint}'
-            )
+        summary = None
+        if hr_data.get('activities-heart'):
+            summary = hr_data['activities-heart'][0]
 
-        # Convert Fitbit hh:mm:ss tags to datetime objects
-        for pt in hr_data['activities-heart-intraday']['dataset']:
-            h, m, s = [int(x) for x in pt['time'].split(':')]
-            dt = datetime.datetime.combine(f_date, datetime.time(h, m, s))
+        # Fitbit hh:mm:ss strings sort chronologically, so the first day can
+        # be filtered without converting every point to a datetime
+        if f_time is not None:
+            dataset = [pt for pt in dataset if pt['time'] >= f_time]
+            f_time = None
 
-            if dt >= f_time:
-                ret_data.append((dt, pt['value']))
+        yield (f_date, summary, dataset)
 
         # Increment the Fetch Day
         f_date += datetime.timedelta(days=1)
 
+
+def get_heartrate(app, since='today', detail='1min'):
+    '''
+    Get Heart Rate Data
+
+    This calls the Fitbit Heart Rate Intraday Time Series endpoint with the
+    parameters taken from argument values. The `since` parameter specifies
+    the starting date and time for the measurement or can contain the string
+    `today`, which will return all points from today.
+
+    Note that the Fitbit API only returns intraday data within a single day,
+    so this method will send multiple requests for each day of data from the
+    `since` parameter until today. Days which have been fully synced are
+    served from the intraday cache rather than the API. If the `since`
+    parameter is a `datetime` object, the time will also be used to filter out
+    points before the time given. Note that the `datetime` instances will be
+    interpreted as user-local time by Fitbit and no timezone data is passed,
+    so the instances should be naive objects without timezone data.
+
+    The return value is an array of (`dt`, `bpm`) tuples where the `dt` value
+    is a naive `datetime` object in the Fitbit-local time zone and `bpm` is the
+    heart rate in beats per minute.
+    '''
+    ret_data = []
+    for day, _, dataset in iter_heartrate(app, since, detail):
+        # Convert Fitbit hh:mm:ss tags to datetime objects
+        for pt in dataset:
+            h, m, s = [int(x) for x in pt['time'].split(':')]
+            dt = datetime.datetime.combine(day, datetime.time(h, m, s))
+            ret_data.append((dt, pt['value']))
+
     # Return fetched data
     return ret_data
@@ -1,7 +1,6 @@
 # Fitbit2Influx OAuth2 Service
 
 import datetime
-import requests
 import shelve
 
 from urllib.parse import quote, urlencode, urlunparse
@@ -85,6 +84,8 @@ def update_tokens(app, token_data):
 
 def request_tokens(app, code):
     '''Request new OAuth2 Tokens for the Application'''
+    import requests
+
     app.logger.info('Requesting OAuth2 access and refresh tokens')
     url_host = app.config['FITBIT_API_HOST']
     url_path = '/oauth2/token'
@@ -109,6 +110,8 @@ def request_tokens(app, code):
 
 def refresh_tokens(app):
     '''Refresh OAuth2 Tokens for the Application'''
+    import requests
+
     refresh_token = None
     with shelve.open(app.config['SHELVE_FILENAME'], 'r') as shelf:
         if 'refresh_token' in shelf:
@@ -164,3 +167,14 @@ def get_api_token(app):
 
     app.logger.debug('Using cached access token')
     return access_token
+
+
+def get_user_id(app):
+    '''Get the Fitbit User Id for the authorized user'''
+    with shelve.open(app.config['SHELVE_FILENAME'], 'r') as shelf:
+        user_id = shelf.get('user_id', None)
+
+    if user_id is None:
+        raise NeedAuthError('No User Id set')
+
+    return user_id
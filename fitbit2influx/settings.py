@@ -15,3 +15,46 @@ TOKEN_VALIDITY = 604800
 
 # ShelveDB Settings
 SHELVE_FILENAME = 'instance/shelf.db'
+
+# Intraday Cache Settings (set CACHE_FILENAME to None to disable)
+CACHE_FILENAME = 'instance/cache.db'
+
+# Maximum number of intraday points held in memory (about 70 days of 1min or
+# one day of 1sec heart rate data)
+CACHE_MEMORY_POINTS = 100000
+
+# Scheduler Settings (set to False for web-only workers)
+SCHEDULER_ENABLED = True
+
+# Transform Pipeline Settings
+TRANSFORM_MEASUREMENT = 'heartRate'
+TRANSFORM_FIELD = 'bpm'
+
+# Static tags added to every point, as a dictionary or "key=value,..." string
+TRANSFORM_TAGS = {}
+
+# Derived tags as {tag name: source}, where the source is one of user_id,
+# device_id, device_version or resting_hr
+TRANSFORM_DERIVED_TAGS = {'userId': 'user_id'}
+
+# Timestamp normalization: "utc" applies the user's offset from UTC, "local"
+# writes Fitbit-local times unchanged
+TRANSFORM_TIMEZONE = 'utc'
+
+# Drop points outside of these values (None to disable)
+TRANSFORM_MIN_VALUE = None
+TRANSFORM_MAX_VALUE = None
+
+# Import Profiling Settings. PROFILE_MODE is "cprofile" (.prof and .txt
+# output) or "sample" (collapsed stacks for flame graphs). cProfile records
+# everything on the OS thread, so under the gevent worker (as in the Docker
+# image) it would include other greenlets. Sample mode is always used under
+# gevent, with a warning logged if "cprofile" is configured.
+PROFILE_IMPORTS = False
+PROFILE_MODE = 'cprofile'
+PROFILE_DIR = 'instance/profiles'
+PROFILE_KEEP = 20
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Number of import runs kept in the run log
+RUN_LOG_SIZE = 50
@@ -0,0 +1,127 @@
+# Fitbit2Influx Startup Profiling
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+#: Code run in the child process to build the application and report its
+#: peak RSS on stdout
+STARTUP_CODE = (
+    'from fitbit2influx.factory import create_app; create_app(); '
+    'from fitbit2influx.util import max_rss_mb; print(max_rss_mb())'
+)
+
+
+def parse_importtime(output):
+    '''
+    Parse the output of `python -X importtime`
+
+    Returns a list of (`module`, `self_us`, `cumulative_us`) tuples, one for
+    each imported module in import order.
+    '''
+    ret = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # Header Line
+            continue
+
+        ret.append((fields[2].strip(), self_us, cumulative_us))
+
+    return ret
+
+
+def profile_startup(scheduler=False):
+    '''
+    Profile Application Startup
+
+    Runs :func:`create_app` in a fresh interpreter with `-X importtime` and
+    returns a tuple of (`imports`, `wall_ms`, `rss_mb`) where `imports` is the
+    parsed import list from :func:`parse_importtime` and `rss_mb` is the peak
+    RSS of the child process (or `None` if not available).
+    '''
+    env = dict(os.environ)
+    env['FB2I_SCHEDULER_ENABLED'] = 'true' if scheduler else 'false'
+
+    start_time = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall_ms = (time.perf_counter() - start_time) * 1000
+
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise RuntimeError(
+            f'Application startup failed with exit code {proc.returncode}'
+        )
+
+    rss_mb = None
+    lines = proc.stdout.strip().splitlines()
+    if lines and lines[-1] != 'None':
+        rss_mb = float(lines[-1])
+
+    return (parse_importtime(proc.stderr), wall_ms, rss_mb)
+
+
+def print_report(imports, wall_ms, rss_mb=None, top=20, out=sys.stdout):
+    '''Print an Import Time Report'''
+    total_us = sum(i[1] for i in imports)
+    out.write(f'Startup wall time: {wall_ms:.1f} ms\n')
+    if rss_mb is not None:
+        out.write(f'Peak RSS: {rss_mb} MB\n')
+    out.write(
+        f'Total import time: {total_us / 1000:.1f} ms '
+        f'({len(imports)} modules)\n'
+    )
+
+    packages = {}
+    for name, self_us, _ in imports:
+        pkg = name.split('.')[0]
+        packages[pkg] = packages.get(pkg, 0) + self_us
+
+    out.write(f'\nTop {top} packages by total import time:\n')
+    for pkg, us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        out.write(f'  {us / 1000:8.1f} ms  {pkg}\n')
+
+    out.write(f'\nTop {top} modules by self import time:\n')
+    for name, self_us, _ in sorted(imports, key=lambda x: -x[1])[:top]:
+        out.write(f'  {self_us / 1000:8.1f} ms  {name}\n')
+
+
+def main(argv=None):
+    '''Command Line Entry Point'''
+    parser = argparse.ArgumentParser(
+        prog='python -m fitbit2influx.startup',
+        description='Report Fitbit2Influx application startup import times',
+    )
+    parser.add_argument(
+        '--top', type=int, default=20,
+        help='number of packages and modules to list',
+    )
+    parser.add_argument(
+        '--scheduler', action='store_true',
+        help='also start the import scheduler (default: web-only)',
+    )
+    args = parser.parse_args(argv)
+
+    imports, wall_ms, rss_mb = profile_startup(scheduler=args.scheduler)
+    print_report(imports, wall_ms, rss_mb, top=args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# Fitbit2Influx Point Transform Pipeline
+
+import calendar
+
+from fitbit2influx.error import ConfigError
+
+#: Derived Tag Sources which are looked up once per import run
+RUN_SOURCES = ('user_id', 'device_id', 'device_version')
+
+#: Derived Tag Sources which are looked up for each day of data
+DAY_SOURCES = ('resting_hr', )
+
+#: Supported Timestamp Normalizations
+TIMEZONES = ('utc', 'local')
+
+
+def parse_mapping(value, config_key):
+    '''
+    Parse a Mapping Configuration Value
+
+    Accepts either a dictionary (from a configuration file) or a string of
+    comma-separated `key=value` pairs (from an `FB2I_` environment variable).
+    '''
+    if value is None:
+        return {}
+
+    if isinstance(value, dict):
+        return dict(value)
+
+    if not isinstance(value, str):
+        raise ConfigError(
+            f'{config_key} must be a dictionary or string',
+            config_key=config_key,
+        )
+
+    ret = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        if '=' not in item:
+            raise ConfigError(
+                f'{config_key} entries must have the form key=value',
+                config_key=config_key,
+            )
+
+        k, v = item.split('=', 1)
+        ret[k.strip()] = v.strip()
+
+    return ret
+
+
+def parse_number(value, config_key):
+    '''Parse an optional numeric Configuration Value'''
+    if value is None or value == '':
+        return None
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ConfigError(
+            f'{config_key} must be a number',
+            config_key=config_key,
+        )
+
+
+def time_to_seconds(t):
+    '''Convert a Fitbit `hh:mm:ss` string to seconds since midnight'''
+    return int(t[0:2]) * 3600 + int(t[3:5]) * 60 + int(t[6:8])
+
+
+class Pipeline(object):
+    '''
+    Compiled Point Transform Pipeline
+
+    Converts one day of raw Fitbit intraday points into InfluxDB JSON points
+    and the tag set for that day. Settings are resolved once when the pipeline
+    is compiled, so each day is converted with a single list comprehension
+    that computes timestamps as integer offsets from the start of the day
+    rather than building `datetime` objects for each point.
+
+    Derived tags map a tag name to one of the sources in :data:`RUN_SOURCES`
+    (provided in the run context) or :data:`DAY_SOURCES` (taken from the
+    daily summary). Since tags are constant within a day, they are returned
+    separately to be sent as batch-level tags with the write.
+    '''
+    def __init__(
+        self, measurement='heartRate', field='bpm', static_tags=None,
+        derived_tags=None, timezone='utc', min_value=None, max_value=None,
+    ):
+        self.measurement = measurement
+        self.field = field
+        self.static_tags = static_tags or {}
+        self.derived_tags = derived_tags or {}
+        self.timezone = timezone
+        self.min_value = min_value
+        self.max_value = max_value
+
+        for tag, source in self.derived_tags.items():
+            if source not in RUN_SOURCES and source not in DAY_SOURCES:
+                raise ConfigError(
+                    f'Unknown derived tag source "{source}" for tag "{tag}"',
+                    config_key='TRANSFORM_DERIVED_TAGS',
+                )
+
+        if self.timezone not in TIMEZONES:
+            raise ConfigError(
+                f'TRANSFORM_TIMEZONE must be one of {", ".join(TIMEZONES)}',
+                config_key='TRANSFORM_TIMEZONE',
+            )
+
+        # Unset bounds are resolved once so the filter is a plain comparison
+        # in the point comprehension
+        self._lo = float('-inf') if min_value is None else min_value
+        self._hi = float('inf') if max_value is None else max_value
+
+    def uses(self, source):
+        '''Check if a derived tag source is used by the pipeline'''
+        return source in self.derived_tags.values()
+
+    def tags(self, summary, context):
+        '''Build the Tag Set for one day of data'''
+        tags = dict(self.static_tags)
+        for tag, source in self.derived_tags.items():
+            if source == 'resting_hr':
+                value = (summary or {}).get('value', {})
+                value = value.get('restingHeartRate')
+            else:
+                value = context.get(source)
+
+            if value is not None:
+                tags[tag] = str(value)
+
+        return tags
+
+    def __call__(self, day, summary, dataset, context):
+        '''
+        Transform one day of Intraday Data
+
+        Returns a tuple of (`points`, `tags`). Point timestamps are integer
+        seconds since the epoch, to be written with `time_precision='s'`.
+        The `context` dictionary must contain `utc_offset` (the user offset
+        from UTC in seconds) along with any run-level derived tag sources.
+        '''
+        base = calendar.timegm(day.timetuple())
+        if self.timezone == 'utc':
+            base -= context['utc_offset']
+
+        measurement = self.measurement
+        field = self.field
+        lo = self._lo
+        hi = self._hi
+        points = [
+            {
+                'measurement': measurement,
+                'time': base + time_to_seconds(pt['time']),
+                'fields': {field: pt['value']},
+            }
+            for pt in dataset if lo <= pt['value'] <= hi
+        ]
+
+        return (points, self.tags(summary, context))
+
+
+def compile_pipeline(config):
+    '''Compile a :class:`Pipeline` from the Application Configuration'''
+    return Pipeline(
+        measurement=config.get('TRANSFORM_MEASUREMENT', 'heartRate'),
+        field=config.get('TRANSFORM_FIELD', 'bpm'),
+        static_tags=parse_mapping(
+            config.get('TRANSFORM_TAGS'), 'TRANSFORM_TAGS'
+        ),
+        derived_tags=parse_mapping(
+            config.get('TRANSFORM_DERIVED_TAGS', {'userId': 'user_id'}),
+            'TRANSFORM_DERIVED_TAGS',
+        ),
+        timezone=str(config.get('TRANSFORM_TIMEZONE', 'utc')).lower(),
+        min_value=parse_number(
+            config.get('TRANSFORM_MIN_VALUE'), 'TRANSFORM_MIN_VALUE'
+        ),
+        max_value=parse_number(
+            config.get('TRANSFORM_MAX_VALUE'), 'TRANSFORM_MAX_VALUE'
+        ),
+    )
+
+
+def init_app(app):
+    '''Compile the Transform Pipeline for the Application'''
+    app.transform_pipeline = compile_pipeline(app.config)
+    app.logger.info('Compiled Transform Pipeline')
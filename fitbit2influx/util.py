@@ -0,0 +1,34 @@
+# Fitbit2Influx Utility Functions
+
+import sys
+
+
+def config_flag(value):
+    '''
+    Interpret a Configuration Value as a Flag
+
+    Values loaded from `FB2I_` environment variables are always strings, so
+    these are compared against the usual truthy spellings.
+    '''
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def max_rss_mb():
+    '''
+    Return the Peak Resident Set Size of this process in MB
+
+    Returns `None` on platforms without the :mod:`resource` module.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports bytes rather than kilobytes
+        rss = rss / 1024
+
+    return round(rss / 1024, 1)